@@ -1,52 +1,206 @@
+import bisect
+import functools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
 import torch
 import torch._dynamo
 import torch._dynamo.testing
 import torch._dynamo.utils
-import torch.utils._pytree as pytree
+
+try:
+    # Prefer the C++ (optree) pytree backend when it is installed. Classes
+    # registered through `torch.utils._pytree` are mirrored into it.
+    import torch.utils._cxx_pytree as pytree
+except ImportError:
+    import torch.utils._pytree as pytree
+
+# Key paths for failure messages come from the Python implementation, which
+# knows the containers' `flatten_with_keys_fn`.
+from torch.utils._pytree import keystr, tree_leaves_with_path
 
 from tensorcontainer.tensor_container import TensorContainer
 
+# Older torch versions only know the per-frame limit as `cache_size_limit`.
+_RECOMPILE_LIMIT_NAME = (
+    "recompile_limit"
+    if hasattr(torch._dynamo.config, "recompile_limit")
+    else "cache_size_limit"
+)
+
+# Raise the per-frame limit so that shape sweeps stay compiled instead of
+# silently falling back to eager once the default limit is reached.
+setattr(
+    torch._dynamo.config,
+    _RECOMPILE_LIMIT_NAME,
+    max(getattr(torch._dynamo.config, _RECOMPILE_LIMIT_NAME), 64),
+)
+
+
+@contextmanager
+def _recompile_limit_at_least(limit):
+    """
+    Temporarily raises Dynamo's per-frame recompile limit to at least `limit`.
+    """
+    limit = max(getattr(torch._dynamo.config, _RECOMPILE_LIMIT_NAME), limit)
+    with torch._dynamo.config.patch(**{_RECOMPILE_LIMIT_NAME: limit}):
+        yield
+
+
+# Tolerances for comparing eager and compiled tensors.
+_RTOL = 1e-5
+_ATOL = 1e-6
+
+
+@torch.no_grad()
+def _assert_allclose_batched(pairs):
+    """
+    Asserts that every (name, tensor_a, tensor_b) triple is close.
+
+    Pairs are grouped by dtype and device and each group is checked with a
+    single `torch.isclose` on the concatenated, flattened tensors instead of
+    one call per pair. NaNs in matching positions compare equal. `name` is a
+    callable describing the leaf; it is only called when a check fails. The
+    comparison runs without autograd so grouping leaves that require grad does
+    not record a graph.
+    """
+    groups = defaultdict(lambda: ([], [], [], [0]))
+    for name, tensor_a, tensor_b in pairs:
+        if tensor_a is tensor_b:
+            continue
+        assert tensor_a.shape == tensor_b.shape, f"Tensor shape mismatch at {name()}"
+        assert tensor_a.dtype == tensor_b.dtype, f"Tensor dtype mismatch at {name()}"
+        assert tensor_a.device == tensor_b.device, f"Tensor device mismatch at {name()}"
+        leaves, flat_a, flat_b, offsets = groups[(tensor_a.dtype, tensor_a.device)]
+        leaves.append((name, tensor_a, tensor_b))
+        flat_a.append(tensor_a.reshape(-1))
+        flat_b.append(tensor_b.reshape(-1))
+        offsets.append(offsets[-1] + tensor_a.numel())
+
+    for leaves, flat_a, flat_b, offsets in groups.values():
+        close = torch.isclose(
+            torch.cat(flat_a), torch.cat(flat_b), rtol=_RTOL, atol=_ATOL, equal_nan=True
+        )
+        if close.all():
+            continue
+
+        # Map the first mismatching element back to the leaf it belongs to and
+        # let assert_close report the details for that leaf.
+        first = int((~close).nonzero()[0])
+        name, tensor_a, tensor_b = leaves[bisect.bisect_right(offsets, first) - 1]
+        torch.testing.assert_close(
+            tensor_a,
+            tensor_b,
+            rtol=_RTOL,
+            atol=_ATOL,
+            equal_nan=True,
+            msg=lambda msg, name=name: f"Tensor values mismatch at {name()}: {msg}",
+        )
+
+
+def _tc_leaf_name(path, tc, index):
+    """
+    Returns the key path of the `index`-th leaf of `tc`, prefixed with `path`.
+    """
+    key_path, _ = tree_leaves_with_path(tc)[index]
+    return path + keystr(key_path)
+
+
+def _tc_leaf_pairs(tc_a: TensorContainer, tc_b: TensorContainer, path: str):
+    """
+    Asserts that two TensorContainers match in shape, device and structure and
+    returns their leaves as (name, tensor_a, tensor_b) triples.
+    """
+    assert tc_a.shape == tc_b.shape, f"Shape mismatch at {path}"
+    assert tc_a.device == tc_b.device, f"Device mismatch at {path}"
+
+    # Flatten both containers in a single pass; the spec of the pair holds the
+    # spec of each container as its children.
+    leaves, spec = pytree.tree_flatten((tc_a, tc_b))
+    spec_a, spec_b = spec.children()
+
+    assert spec_a == spec_b, f"PyTree spec mismatch (keys or nesting) at {path}"
+
+    leaves_a, leaves_b = leaves[: spec_a.num_leaves], leaves[spec_a.num_leaves :]
+    return [
+        (functools.partial(_tc_leaf_name, path, tc_a, i), leaf_a, leaf_b)
+        for i, (leaf_a, leaf_b) in enumerate(zip(leaves_a, leaves_b))
+    ]
+
 
 def assert_tc_equal(tc_a: TensorContainer, tc_b: TensorContainer):
     """
     Asserts that two TensorContainers are equal in shape, device, structure, and values.
     """
-    assert tc_a.shape == tc_b.shape, "Shape mismatch"
-    assert tc_a.device == tc_b.device, "Device mismatch"
+    _assert_allclose_batched(_tc_leaf_pairs(tc_a, tc_b, "container"))
 
-    leaves_a, spec_a = pytree.tree_flatten(tc_a)
-    leaves_b, spec_b = pytree.tree_flatten(tc_b)
 
-    assert spec_a == spec_b, "PyTree spec mismatch (keys or nesting)"
+# Sentinel for keys missing from a compiled result.
+_MISSING = object()
 
-    for tensor_a, tensor_b in zip(leaves_a, leaves_b):
-        assert torch.allclose(tensor_a, tensor_b), "Tensor values mismatch"
 
-
-def _compare_results(eager_result, compiled_result):
+def _collect_tensor_pairs(eager_result, compiled_result, pairs, path):
     """
-    Recursively compares eager and compiled results.
+    Recursively walks eager and compiled results, checking non-tensor values
+    directly and appending (name, eager, compiled) tensor triples to `pairs`
+    for a batched comparison. `path` locates the current value in the result.
     """
+    if eager_result is compiled_result:
+        return
+
     if isinstance(eager_result, TensorContainer):
-        assert_tc_equal(eager_result, compiled_result)
+        pairs.extend(_tc_leaf_pairs(eager_result, compiled_result, path))
     elif isinstance(eager_result, torch.Tensor):
-        assert torch.allclose(eager_result, compiled_result)
+        pairs.append((functools.partial(str, path), eager_result, compiled_result))
     elif isinstance(eager_result, (tuple, list)):
-        assert len(eager_result) == len(compiled_result)
-        for er, cr in zip(eager_result, compiled_result):
-            _compare_results(er, cr)
+        assert len(eager_result) == len(compiled_result), f"Length mismatch at {path}"
+        for i, (er, cr) in enumerate(zip(eager_result, compiled_result)):
+            _collect_tensor_pairs(er, cr, pairs, f"{path}[{i}]")
     elif isinstance(eager_result, dict):
-        assert eager_result.keys() == compiled_result.keys()
-        for k in eager_result:
-            _compare_results(eager_result[k], compiled_result[k])
+        # Equal lengths plus every eager key being present implies equal key
+        # sets, so the keys are visited in a single pass.
+        assert len(eager_result) == len(compiled_result), (
+            f"Key count mismatch at {path}: "
+            f"{len(eager_result)} vs {len(compiled_result)}"
+        )
+        for k, er in eager_result.items():
+            cr = compiled_result.get(k, _MISSING)
+            assert cr is not _MISSING, f"Missing key {k!r} in compiled {path}"
+            _collect_tensor_pairs(er, cr, pairs, f"{path}[{k!r}]")
     else:
-        assert eager_result == compiled_result, "Eager and compiled results mismatch"
+        assert eager_result == compiled_result, (
+            f"Eager and compiled results mismatch at {path}"
+        )
+
+
+def _compare_results(eager_result, compiled_result):
+    """
+    Recursively compares eager and compiled results.
+    """
+    pairs = []
+    _collect_tensor_pairs(eager_result, compiled_result, pairs, "result")
+    _assert_allclose_batched(pairs)
+
+
+def _clear_counters_only():
+    """
+    Clears Dynamo's global counters while keeping compiled artifacts cached.
+    """
+    torch._dynamo.utils.counters.clear()
+
+
+def _full_reset():
+    """
+    Clears all Dynamo caches and counters, so that the next call traces from
+    scratch.
+    """
+    torch._dynamo.reset()
 
 
 class GraphBreakCounter:
     def __enter__(self):
-        torch._dynamo.reset()
-        torch._dynamo.utils.counters.clear()
+        _clear_counters_only()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -57,30 +211,123 @@ class GraphBreakCounter:
         return sum(torch._dynamo.utils.counters["graph_break"].values())
 
 
+# Value of `dynamic` used by the helpers when a test does not pass one.
+# Set from the `--compile-dynamic` pytest option.
+_default_dynamic = None
+
+
+def set_default_dynamic(dynamic):
+    """
+    Sets the `dynamic` value used by the helpers when a test does not pass one.
+    """
+    global _default_dynamic
+    _default_dynamic = dynamic
+
+
+def _resolve_dynamic(dynamic):
+    return _default_dynamic if dynamic is None else dynamic
+
+
+# Per-thread CompileCounter shared by the compiled functions of the harness.
+_tls = threading.local()
+
+
+def _get_counter():
+    """
+    Returns this thread's shared CompileCounter with its counts cleared.
+    """
+    counter = getattr(_tls, "counter", None)
+    if counter is None:
+        counter = torch._dynamo.testing.CompileCounter()
+        _tls.counter = counter
+    counter.clear()
+    return counter
+
+
+def _recompile_counter(fresh_compile):
+    """
+    Returns the CompileCounter backend for a recompile measurement.
+
+    After a full reset no cached code refers to the shared counter, so it can
+    be reused. Without a reset, a new counter is needed so that Dynamo's
+    backend guard forces a fresh compilation.
+    """
+    if fresh_compile:
+        return _get_counter()
+    return torch._dynamo.testing.CompileCounter()
+
+
+def get_compiled(fn, fullgraph=True, dynamic=None):
+    """
+    Compiles `fn` with the harness backend and the session's default for
+    `dynamic`.
+    """
+    return torch.compile(
+        fn,
+        fullgraph=fullgraph,
+        dynamic=_resolve_dynamic(dynamic),
+        backend=_get_counter(),
+    )
+
+
+def _cuda_devices(*trees):
+    """
+    Returns the indices of the CUDA devices holding tensors in `trees`.
+    """
+    return sorted(
+        {
+            leaf.device.index
+            for leaf in pytree.tree_leaves(trees)
+            if isinstance(leaf, torch.Tensor) and leaf.device.type == "cuda"
+        }
+    )
+
+
+@contextmanager
+def _seeded(seed, devices):
+    """
+    Seeds the global RNG for the duration of the block and restores the
+    previous RNG state afterwards. Only the CUDA RNGs of `devices` are forked,
+    so CPU-only calls never touch CUDA.
+    """
+    with torch.random.fork_rng(devices=devices):
+        torch.manual_seed(seed)
+        yield
+
+
 def run_and_compare_compiled(
     fn,
     *args,
     fullgraph=True,
     expected_graph_breaks=None,
+    dynamic=None,
+    skip_eager=False,
     **kwargs,
 ):
     """
     Runs a function in eager mode and compiled mode, compares results,
     and asserts the number of graph breaks.
+
+    With `skip_eager=True` only the compiled run happens and `None` is
+    returned in place of the eager result.
     """
+    devices = _cuda_devices(args, kwargs)
+
     # Eager run
-    torch.manual_seed(0)
-    eager_result = fn(*args, **kwargs)
+    eager_result = None
+    if not skip_eager:
+        with _seeded(0, devices):
+            eager_result = fn(*args, **kwargs)
 
     # Compiled run
-    torch.manual_seed(0)
-    counter = torch._dynamo.testing.CompileCounter()
-    with GraphBreakCounter() as gb_counter:
-        compiled_fn = torch.compile(fn, fullgraph=fullgraph, backend=counter)
+    _full_reset()
+    compiled_fn = get_compiled(fn, fullgraph=fullgraph, dynamic=dynamic)
+    with GraphBreakCounter() as gb_counter, _seeded(0, devices):
         compiled_result = compiled_fn(*args, **kwargs)
 
     # Assert results are equal
-    _compare_results(eager_result, compiled_result)
+    if not skip_eager:
+        _compare_results(eager_result, compiled_result)
 
     if expected_graph_breaks is not None:
         assert gb_counter.graph_breaks == expected_graph_breaks, (
@@ -95,9 +342,12 @@ def run_and_count_graph_breaks(fn, *args, expected_graph_breaks: int, fullgraph=
     """
     Runs a function and asserts the number of graph breaks.
     """
-    torch._dynamo.reset()
+    # The eager backend is shared across calls, so a warm cache would skip
+    # tracing and record no graph breaks.
+    _full_reset()
     with GraphBreakCounter() as gb_counter:
-        compiled_fn = torch.compile(fn, fullgraph=fullgraph)
+        # Only graph breaks are inspected, so skip AOTAutograd and Inductor.
+        compiled_fn = torch.compile(fn, fullgraph=fullgraph, backend="eager")
         compiled_fn(*args)
 
     assert gb_counter.graph_breaks == expected_graph_breaks, (
@@ -106,7 +356,9 @@ def run_and_count_graph_breaks(fn, *args, expected_graph_breaks: int, fullgraph=
     )
 
 
-def run_and_count_recompiles(fn, *args, expected_recompiles: int):
+def run_and_count_recompiles(
+    fn, *args, expected_recompiles: int, dynamic=None, fresh_compile=True
+):
     """
     Runs a function multiple times with different inputs and asserts the number of
     recompilations.
@@ -120,20 +372,30 @@ def run_and_count_recompiles(fn, *args, expected_recompiles: int):
             separate call to the function `fn`. For example, to call `fn` twice
             with different tensors, you might pass `(torch.randn(2),), (torch.randn(3),)`.
         expected_recompiles (int): The expected number of recompilations.
+        dynamic (bool | None): Forwarded to `torch.compile`. `True` compiles a
+            single graph with symbolic shapes, so shape changes do not recompile.
+        fresh_compile (bool): Reset all Dynamo caches before compiling. Dynamo
+            keeps per-code-object state such as automatic dynamic shapes
+            across calls, so without a reset the count depends on earlier
+            calls of `fn`. Only pass `False` if `fn` has not been compiled
+            before.
     """
-    # Reset dynamo counters to ensure a clean measurement
-    torch._dynamo.reset()
+    if fresh_compile:
+        _full_reset()
 
     if not args:
         num_compiles = 0
     else:
         # Use CompileCounter as a backend to count compilations
-        counter = torch._dynamo.testing.CompileCounter()
-        compiled_fn = torch.compile(fn, backend=counter, fullgraph=True)
+        counter = _recompile_counter(fresh_compile)
+        compiled_fn = torch.compile(
+            fn, backend=counter, fullgraph=True, dynamic=_resolve_dynamic(dynamic)
+        )
 
         # Invoke the compiled function with each set of arguments
-        for arg_set in args:
-            compiled_fn(*arg_set)
+        with _recompile_limit_at_least(len(args)):
+            for arg_set in args:
+                compiled_fn(*arg_set)
 
         num_compiles = counter.frame_count
 
@@ -148,7 +410,9 @@ def run_and_count_recompiles(fn, *args, expected_recompiles: int):
     )
 
 
-def get_graph_breaks_and_recompiles(fn, *args, fullgraph=True):
+def get_graph_breaks_and_recompiles(
+    fn, *args, fullgraph=True, dynamic=None, fresh_compile=True
+):
     """
     Runs a function and returns the number of graph breaks and recompiles.
     This function compiles the given function `fn` and then runs it with each set
@@ -161,29 +425,36 @@ def get_graph_breaks_and_recompiles(fn, *args, fullgraph=True):
             separate call to the function `fn`.
         fullgraph (bool): A flag to indicate if `torch.compile` should use
             fullgraph mode.
+        dynamic (bool | None): Forwarded to `torch.compile`.
+        fresh_compile (bool): Reset all Dynamo caches before compiling, so the
+            counts do not depend on earlier calls of `fn`.
     Returns:
         A tuple containing:
             - The total number of graph breaks.
             - The number of recompilations.
     """
-    torch._dynamo.reset()
+    if fresh_compile:
+        _full_reset()
     if not args:
         return 0, 0
 
-    counter = torch._dynamo.testing.CompileCounter()
-    compiled_fn = torch.compile(fn, backend=counter, fullgraph=fullgraph)
+    counter = _recompile_counter(fresh_compile)
+    compiled_fn = torch.compile(
+        fn, backend=counter, fullgraph=fullgraph, dynamic=_resolve_dynamic(dynamic)
+    )
 
     # First call
-    torch._dynamo.utils.counters.clear()
+    _clear_counters_only()
     compiled_fn(*args[0])
     total_breaks = sum(torch._dynamo.utils.counters["graph_break"].values())
     compiles_after_first_call = counter.frame_count
 
     # Subsequent calls
-    for arg_set in args[1:]:
-        torch._dynamo.utils.counters["graph_break"].clear()
-        compiled_fn(*arg_set)
-        total_breaks += sum(torch._dynamo.utils.counters["graph_break"].values())
+    with _recompile_limit_at_least(len(args)):
+        for arg_set in args[1:]:
+            torch._dynamo.utils.counters["graph_break"].clear()
+            compiled_fn(*arg_set)
+            total_breaks += sum(torch._dynamo.utils.counters["graph_break"].values())
 
     recompiles = counter.frame_count - compiles_after_first_call
     return total_breaks, recompiles
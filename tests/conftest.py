@@ -4,6 +4,8 @@ import pytest
 import torch
 from torch._inductor import exc as inductor_exc
 
+from tests.compile_utils import set_default_dynamic
+
 
 @pytest.fixture
 def nested_dict():
@@ -55,10 +57,23 @@ skipif_no_cuda = pytest.mark.skipif(
 )
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--compile-dynamic",
+        action="store_true",
+        default=False,
+        help="Compile with dynamic=True in the compile test helpers unless a "
+        "test passes `dynamic` explicitly.",
+    )
+
+
 def pytest_configure(config):
     """
     Pytest hook to dynamically register markers.
     """
+    if config.getoption("--compile-dynamic"):
+        set_default_dynamic(True)
+
     config.addinivalue_line(
         "markers",
         "skipif_no_compile: skip test if C++ compiler is not available",
@@ -102,7 +102,8 @@ class TestCat:
         td2.tensor.mul_(2)
         td2.tensor_data_class.tensor.mul_(2)
 
-        run_and_compare_compiled(self._cat_operation, [td1, td2], 0)
+        # Tracing the nested dataclass with symbolic shapes is unsupported.
+        run_and_compare_compiled(self._cat_operation, [td1, td2], 0, dynamic=False)
 
     @skipif_no_compile
     def test_cat_compile_invalid_dim_raises(self, nested_tensor_data_class):
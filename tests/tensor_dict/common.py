@@ -1,4 +1,5 @@
 import torch
+import torch.utils._pytree as pytree
 
 
 def nested_dict():
@@ -41,18 +42,22 @@ def compute_stack_shape(shape, dim, num_tensors=2):
 
 
 def compare_nested_dict(data, output, expect_fn):
-    for key, val in data.items():
-        # It's a nested structure (like TensorDict)
-        if hasattr(val, "data") and isinstance(val.data, dict):
-            compare_nested_dict(val.data, output[key].data, expect_fn)
-        elif isinstance(val, torch.Tensor):
-            orig = val
-            out = output[key]
-            expect = expect_fn(orig)
-            assert out.shape == expect.shape, (
-                f"Shape mismatch for {key}: {out.shape} vs {expect.shape}"
-            )
-            # Use allclose for robust float comparison
-            assert torch.allclose(out.to(torch.float32), expect.to(torch.float32)), (
-                f"Tensor mismatch for {key}"
-            )
+    # TensorDict is a registered pytree node, so nested dicts and TensorDicts
+    # flatten to their tensors together with their key paths.
+    data_leaves = pytree.tree_leaves_with_path(data)
+    output_leaves = pytree.tree_leaves_with_path(output)
+    data_keys = [pytree.keystr(key_path) for key_path, _ in data_leaves]
+    output_keys = [pytree.keystr(key_path) for key_path, _ in output_leaves]
+    assert data_keys == output_keys, f"Key mismatch: {data_keys} vs {output_keys}"
+
+    for key, (_, orig), (_, out) in zip(data_keys, data_leaves, output_leaves):
+        # assert_close also checks shape and dtype, and compares in the
+        # source dtype to avoid copying both tensors
+        torch.testing.assert_close(
+            out,
+            expect_fn(orig),
+            atol=1e-5,
+            rtol=1e-5,
+            equal_nan=True,
+            msg=lambda msg, key=key: f"Mismatch for {key}: {msg}",
+        )
@@ -7,6 +7,30 @@ def deterministic_seed():
     torch.manual_seed(0)
 
 
+@pytest.fixture(scope="module")
+def normal_inputs():
+    """
+    (loc, scale) pairs shared by the TensorNormal tests of a module. The
+    tensors are never modified in place, so they are built once per module.
+    """
+    return {
+        "scalar": (
+            torch.tensor(0.0, requires_grad=True),
+            torch.tensor(1.0, requires_grad=True),
+        ),
+        "vec3": (torch.zeros(3), torch.ones(3)),
+        "linspace4": (
+            torch.linspace(-1, 1, steps=4),
+            torch.linspace(0.5, 1.5, steps=4),
+        ),
+        "mat23": (torch.zeros(2, 3), torch.ones(2, 3) * 2.0),
+        "mat22": (
+            torch.tensor([[0.0, 1.0], [2.0, 3.0]]),
+            torch.tensor([[1.0, 2.0], [3.0, 4.0]]),
+        ),
+    }
+
+
 def normalize_device(dev: torch.device) -> torch.device:
     d = torch.device(dev)
     # If no index was given, fill in current_device() for CUDA, leave CPU as-is
@@ -1,13 +1,47 @@
+import pytest
 import torch
 from torch.distributions import Independent, Normal
 
 from tensorcontainer.tensor_distribution import TensorNormal
+from tests.compile_utils import get_compiled
 
+compile_modes = pytest.mark.parametrize(
+    "compile_mode",
+    [
+        pytest.param(False, id="eager"),
+        pytest.param(True, id="compiled"),
+    ],
+)
 
-def test_rsample_returns_differentiable_tensor_and_correct_shape():
+
+def _rsample(td, sample_shape=torch.Size()):
+    return td.rsample(sample_shape=sample_shape)
+
+
+def _sample(td, sample_shape=torch.Size()):
+    return td.sample(sample_shape=sample_shape)
+
+
+def _entropy(td):
+    return td.entropy()
+
+
+def _log_prob(td, value):
+    return td.log_prob(value)
+
+
+def _maybe_compile(fn, compile_mode):
+    # The harness backend runs the traced graph eagerly, so compiled cases check
+    # Dynamo tracing without needing Inductor or a C++ compiler.
+    return get_compiled(fn, dynamic=True) if compile_mode else fn
+
+
+@compile_modes
+def test_rsample_returns_differentiable_tensor_and_correct_shape(
+    normal_inputs, compile_mode
+):
     # scalar Normal distribution
-    loc = torch.tensor(0.0, requires_grad=True)
-    scale = torch.tensor(1.0, requires_grad=True)
+    loc, scale = normal_inputs["scalar"]
     td = TensorNormal(
         loc=loc,
         scale=scale,
@@ -17,21 +51,24 @@ def test_rsample_returns_differentiable_tensor_and_correct_shape():
     )
 
     # default rsample: no sample_shape
-    x = td.rsample()
+    rsample = _maybe_compile(_rsample, compile_mode)
+    x = rsample(td)
     # must require grad because rsample is reparameterized
     assert isinstance(x, torch.Tensor)
     assert x.requires_grad
     assert x.shape == torch.Size([])
 
     # with sample_shape
-    x2 = td.rsample(sample_shape=torch.Size([5]))
+    x2 = rsample(td, sample_shape=torch.Size([5]))
     assert x2.shape == torch.Size([5])
     assert x2.requires_grad
 
 
-def test_sample_returns_nondifferentiable_tensor_and_correct_shape():
-    loc = torch.zeros(3)
-    scale = torch.ones(3)
+@compile_modes
+def test_sample_returns_nondifferentiable_tensor_and_correct_shape(
+    normal_inputs, compile_mode
+):
+    loc, scale = normal_inputs["vec3"]
     td = TensorNormal(
         loc=loc,
         scale=scale,
@@ -41,21 +78,21 @@ def test_sample_returns_nondifferentiable_tensor_and_correct_shape():
     )
 
     # default sample: draws one event of shape (3,)
-    s = td.sample()
+    sample = _maybe_compile(_sample, compile_mode)
+    s = sample(td)
     assert isinstance(s, torch.Tensor)
     # sample is not reparameterized => no grad
     assert not s.requires_grad
     assert s.shape == torch.Size([3])
 
     # with sample_shape
-    s2 = td.sample(sample_shape=torch.Size([4, 2]))
+    s2 = sample(td, sample_shape=torch.Size([4, 2]))
     # event_shape=(3,), so shape = (4,2,3)
     assert s2.shape == torch.Size([4, 2, 3])
 
 
-def test_mean_stddev_mode_match_underlying_distribution():
-    loc = torch.linspace(-1, 1, steps=4)
-    scale = torch.linspace(0.5, 1.5, steps=4)
+def test_mean_stddev_mode_match_underlying_distribution(normal_inputs):
+    loc, scale = normal_inputs["linspace4"]
     td = TensorNormal(
         loc=loc,
         scale=scale,
@@ -66,15 +103,15 @@ def test_mean_stddev_mode_match_underlying_distribution():
 
     dist = Independent(Normal(loc=loc, scale=scale), 1)
     # properties on TensorNormal
-    assert torch.allclose(td.mean, dist.mean)
-    assert torch.allclose(td.stddev, dist.stddev)
+    torch.testing.assert_close(td.mean, dist.mean)
+    torch.testing.assert_close(td.stddev, dist.stddev)
     # mode for Normal is the same as mean
-    assert torch.allclose(td.mode, dist.mode)
+    torch.testing.assert_close(td.mode, dist.mode)
 
 
-def test_entropy_matches_underlying_distribution():
-    loc = torch.zeros(2, 3)
-    scale = torch.ones(2, 3) * 2.0
+@compile_modes
+def test_entropy_matches_underlying_distribution(normal_inputs, compile_mode):
+    loc, scale = normal_inputs["mat23"]
     # treat last two dims as event dims => entropy summed over them
     td = TensorNormal(
         loc=loc,
@@ -85,16 +122,16 @@ def test_entropy_matches_underlying_distribution():
     )
 
     dist = Independent(Normal(loc=loc, scale=scale), 2)
-    ent_td = td.entropy()
+    ent_td = _maybe_compile(_entropy, compile_mode)(td)
     ent_dist = dist.entropy()
     # shapes should match batch_shape=()
     assert ent_td.shape == ent_dist.shape
-    assert torch.allclose(ent_td, ent_dist)
+    torch.testing.assert_close(ent_td, ent_dist)
 
 
-def test_log_prob_agrees_with_underlying_distribution():
-    loc = torch.tensor([[0.0, 1.0], [2.0, 3.0]])
-    scale = torch.tensor([[1.0, 2.0], [3.0, 4.0]])
+@compile_modes
+def test_log_prob_agrees_with_underlying_distribution(normal_inputs, compile_mode):
+    loc, scale = normal_inputs["mat22"]
     td = TensorNormal(
         loc=loc,
         scale=scale,
@@ -106,8 +143,8 @@ def test_log_prob_agrees_with_underlying_distribution():
     dist = Independent(Normal(loc=loc, scale=scale), 2)
     # draw a sample to evaluate log_prob
     sample = td.sample(sample_shape=torch.Size([5]))  # shape (5,2,2)
-    lp_td = td.log_prob(sample)
+    lp_td = _maybe_compile(_log_prob, compile_mode)(td, sample)
     lp_dist = dist.log_prob(sample)
     # log_prob should match exactly, shape = (5,)
     assert lp_td.shape == lp_dist.shape
-    assert torch.allclose(lp_td, lp_dist)
+    torch.testing.assert_close(lp_td, lp_dist)
@@ -14,8 +14,10 @@ def test_init_valid():
     """Tests that TensorTruncatedNormal can be instantiated with valid parameters."""
     loc = torch.zeros(2, 3)
     scale = torch.ones(2, 3)
-    low = torch.full_like(loc, -0.5)
-    high = torch.full_like(loc, 0.5)
+    # The bounds must carry the batch shape; expanding a scalar gives a view
+    # with that shape without materializing the constant.
+    low = torch.tensor(-0.5).expand_as(loc)
+    high = torch.tensor(0.5).expand_as(loc)
     dist = TensorTruncatedNormal(
         loc=loc,
         scale=scale,
@@ -35,8 +37,8 @@ def test_sample_shape_and_dtype():
     """
     loc = torch.randn(4, 3)
     scale = torch.rand(4, 3) + 1e-6  # ensure scale is positive
-    low = torch.full_like(loc, -0.5)
-    high = torch.full_like(loc, 0.5)
+    low = torch.tensor(-0.5).expand_as(loc)
+    high = torch.tensor(0.5).expand_as(loc)
     dist = TensorTruncatedNormal(
         loc=loc,
         scale=scale,
@@ -54,6 +56,18 @@ def test_sample_shape_and_dtype():
     assert samples.dtype == torch.float32
 
 
+@pytest.fixture(scope="module")
+def trunc_normal_params():
+    """
+    loc, scale, low and high shared by the parametrized log_prob cases.
+    """
+    loc = torch.tensor([[0.0, 1.0, -1.0], [0.5, -0.5, 0.5]])
+    scale = torch.tensor([[0.2, 0.8, 0.1], [0.5, 0.5, 0.5]])
+    low = torch.tensor(-1.0).expand_as(loc)
+    high = torch.tensor(1.0).expand_as(loc)
+    return loc, scale, low, high
+
+
 @pytest.mark.parametrize(
     "rbn_dims,expected_shape",
     [
@@ -62,16 +76,15 @@ def test_sample_shape_and_dtype():
         (2, ()),  # sum over the last two dimensions -> scalar
     ],
 )
-def test_log_prob_reinterpreted_batch_ndims(rbn_dims, expected_shape):
+def test_log_prob_reinterpreted_batch_ndims(
+    trunc_normal_params, rbn_dims, expected_shape
+):
     """
     Tests the log_prob method with different values for
     reinterpreted_batch_ndims, ensuring the output shape and values are correct
     by comparing with torch.distributions.Normal.
     """
-    loc = torch.tensor([[0.0, 1.0, -1.0], [0.5, -0.5, 0.5]])
-    scale = torch.tensor([[0.2, 0.8, 0.1], [0.5, 0.5, 0.5]])
-    low = torch.full_like(loc, -1.0)
-    high = torch.full_like(loc, 1.0)
+    loc, scale, low, high = trunc_normal_params
     dist = TensorTruncatedNormal(
         loc=loc,
         scale=scale,
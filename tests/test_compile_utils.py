@@ -2,7 +2,9 @@ import torch
 import pytest
 import torch._dynamo
 
+from tensorcontainer.tensor_dict import TensorDict
 from tests.compile_utils import (
+    assert_tc_equal,
     get_graph_breaks_and_recompiles,
     run_and_compare_compiled,
     run_and_count_recompiles,
@@ -49,6 +51,67 @@ def test_run_and_compare_compiled_fails():
         )
 
 
+def test_run_and_compare_compiled_skip_eager():
+    """Skipping the eager run returns None in place of the eager result."""
+    x = torch.randn(3, 4)
+    eager_result, compiled_result = run_and_compare_compiled(
+        no_break, (x,), skip_eager=True
+    )
+    assert eager_result is None
+    torch.testing.assert_close(compiled_result, no_break((x,)))
+
+
+def test_run_and_compare_compiled_restores_rng_state():
+    """
+    Both runs are seeded inside a forked RNG, so the caller's global RNG state
+    is left untouched.
+    """
+    x = torch.randn(3, 4)
+    torch.manual_seed(123)
+    state_before = torch.get_rng_state()
+    run_and_compare_compiled(no_break, (x,))
+    assert torch.equal(torch.get_rng_state(), state_before)
+
+
+def test_run_and_compare_compiled_forks_no_cuda_rng_for_cpu_args(monkeypatch):
+    """
+    With only CPU tensors as arguments, no CUDA RNG state is forked, so CPU-only
+    tests never initialize CUDA.
+    """
+    fork_rng = torch.random.fork_rng
+    forked_devices = []
+
+    def recording_fork_rng(*args, devices=None, **kwargs):
+        forked_devices.append(devices)
+        return fork_rng(*args, devices=devices, **kwargs)
+
+    monkeypatch.setattr(torch.random, "fork_rng", recording_fork_rng)
+    run_and_compare_compiled(no_break, (torch.randn(3, 4),))
+    assert forked_devices == [[], []]
+
+
+def test_run_and_compare_compiled_sees_in_place_updates():
+    """
+    Repeated calls with an argument that was modified in place compare
+    against a fresh eager result.
+    """
+    x = torch.ones(3, 4)
+    run_and_compare_compiled(no_break, (x,))
+    x.add_(1)
+    run_and_compare_compiled(no_break, (x,))
+
+
+def test_assert_tc_equal_names_mismatching_leaf():
+    """
+    Values are compared on one concatenated buffer, but a failure must still
+    name the leaf holding the first mismatching element.
+    """
+    td_a = TensorDict({"x": {"a": torch.zeros(2, 3)}, "y": torch.ones(2)}, shape=(2,))
+    td_b = TensorDict({"x": {"a": torch.zeros(2, 3)}, "y": torch.zeros(2)}, shape=(2,))
+    with pytest.raises(AssertionError, match=r"mismatch at container\['y'\]"):
+        assert_tc_equal(td_a, td_b)
+
+
 def recursive_recompile(i):
     if i > 0:
         i -= 1
@@ -111,6 +174,46 @@ def test_run_and_count_recompiles_parameterized(func, args, expected_recompiles)
     run_and_count_recompiles(func, *args, expected_recompiles=expected_recompiles)
 
 
+@pytest.mark.parametrize(
+    "dynamic, expected_recompiles",
+    [
+        (False, 1),
+        (True, 0),
+    ],
+)
+def test_run_and_count_recompiles_shape_change(dynamic, expected_recompiles):
+    """
+    A shape change recompiles a statically specialized graph, while a dynamic
+    graph serves both shapes.
+    """
+    run_and_count_recompiles(
+        no_break,
+        (torch.randn(2),),
+        (torch.randn(3),),
+        expected_recompiles=expected_recompiles,
+        dynamic=dynamic,
+    )
+
+
+def add_one(x):
+    return x + 1
+
+
+def test_run_and_count_recompiles_independent_of_earlier_calls(request):
+    """
+    Automatic dynamic shapes recorded by an earlier sweep must not change the
+    recompile count of a later sweep over the same function.
+    """
+    if request.config.getoption("--compile-dynamic"):
+        pytest.skip("automatic dynamic shapes only apply with dynamic=None")
+    run_and_count_recompiles(
+        add_one, (torch.randn(4),), (torch.randn(5),), expected_recompiles=1
+    )
+    run_and_count_recompiles(
+        add_one, (torch.randn(2),), (torch.randn(3),), expected_recompiles=1
+    )
+
+
 @pytest.mark.parametrize(
     "func, args, expected_breaks, expected_recompiles, fullgraph",
     [